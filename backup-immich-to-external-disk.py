@@ -9,9 +9,20 @@
 '''
 
 import argparse
+import http.client
+import json
 import os
+import re
+import select
+import socket
 import subprocess
 import shutil
+import sys
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from dataclasses import dataclass
 from datetime import datetime
 from pathlib import Path
 
@@ -19,49 +30,169 @@ from pathlib import Path
 MOUNT_POINT = "/run/media/immich/immich-backup"
 BACKUP_DIR = Path(MOUNT_POINT) / "immich-backups"
 SOURCE_DIR = Path(__file__).parent.resolve()
-VOLUMES_TO_BACKUP = ["library", "postgres"]
 MAX_BACKUPS = 7
+# Sidecar written into each completed backup: JSON with the byte total (so
+# listings never re-walk the tree) and the completion timestamp (so the
+# unchanged-library check doesn't have to trust directory mtimes, which get
+# bumped by unrelated writes like a sidecar backfill). Older backups may
+# hold a bare integer byte count instead.
+SIZE_SIDECAR = ".size"
 
 
 def is_mounted(path):
-    return os.path.ismount(path)
+    # os.path.ismount stats the path and its parent, which on a dead or
+    # disconnected USB disk can block for the driver's full I/O timeout.
+    # mountinfo is served from kernel memory and never touches the device.
+    target = os.path.realpath(path)
+    try:
+        with open("/proc/self/mountinfo") as f:
+            return any(line.split()[4] == target for line in f)
+    except OSError:
+        return os.path.ismount(path)
 
 
-def get_backups():
-    if not BACKUP_DIR.exists():
-        return []
-    return sorted([d for d in BACKUP_DIR.iterdir() if d.is_dir()])
+# Directories renamed aside by maybe_delete_oldest, reaped at the end of the
+# run so the user never waits on a 100k-inode unlink storm.
+_trash = []
+
+# get_backups is called several times per run; the directory only changes
+# when we ourselves mutate it, so cache the sorted listing.
+_backups_cache = None
+
+
+def get_backups(refresh=False):
+    global _backups_cache
+    if _backups_cache is None or refresh:
+        if not BACKUP_DIR.exists():
+            return []
+        with os.scandir(BACKUP_DIR) as it:
+            # DirEntry type checks come from the directory read itself,
+            # no extra stat per entry.
+            _backups_cache = sorted(
+                (Path(e.path) for e in it
+                 if e.is_dir(follow_symlinks=False) and not e.name.startswith('.')),
+                key=lambda p: p.name
+            )
+    return _backups_cache
+
+
+# Precomputed bar characters; one slice replaces two string multiplies
+# and a concat per call. Supports any width up to 40.
+_BAR = "#" * 40 + "-" * 40
 
 
 def show_space_bar(used, total, width=40):
     if total == 0:
         return "[" + "?" * width + "]"
-    ratio = used / total
-    filled = int(width * ratio)
-    return f"[{'#' * filled}{'-' * (width - filled)}] {ratio * 100:.1f}%"
+    filled = (used * width) // total
+    offset = 40 - filled
+    return f"[{_BAR[offset:offset + width]}] {used * 100.0 / total:.1f}%"
+
+
+@dataclass
+class DiskState:
+    used: int
+    total: int
+    free: int
 
 
-def show_disk_stats():
-    usage = shutil.disk_usage(MOUNT_POINT)
-    used_gb = usage.used / (1024**3)
-    total_gb = usage.total / (1024**3)
-    free_gb = usage.free / (1024**3)
+def disk_snapshot():
+    st = os.statvfs(MOUNT_POINT)
+    total = st.f_frsize * st.f_blocks
+    free = st.f_frsize * st.f_bavail
+    return DiskState(used=total - free, total=total, free=free)
 
+
+def show_disk_stats(state):
     print(f"\nDisk: {MOUNT_POINT}")
-    print(f"  {show_space_bar(usage.used, usage.total)}")
-    print(f"  Used: {used_gb:.1f} GB / {total_gb:.1f} GB ({free_gb:.1f} GB free)")
+    print(f"  {show_space_bar(state.used, state.total)}")
+    print(f"  Used: {state.used / (1024**3):.1f} GB / "
+          f"{state.total / (1024**3):.1f} GB "
+          f"({state.free / (1024**3):.1f} GB free)")
+
+
+def _dir_size(path):
+    """Total size in bytes of all regular files under path.
+
+    Uses os.scandir so file type comes from the directory entry itself
+    (no extra stat per entry on Linux), which is much faster than du or
+    rglob on a large photo library.
+    """
+    total = 0
+    stack = [str(path)]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except FileNotFoundError:
+            continue
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        total += entry.stat(follow_symlinks=False).st_size
+                except FileNotFoundError:
+                    # Entry vanished mid-walk (e.g. background trash
+                    # deletion); just skip it.
+                    continue
+    return total
+
+
+def _read_sidecar(path):
+    """Returns (byte total, completion timestamp) from a backup's sidecar.
+
+    Either value is None when absent; legacy bare-integer sidecars carry
+    no timestamp.
+    """
+    try:
+        data = json.loads((Path(path) / SIZE_SIDECAR).read_text())
+    except (OSError, ValueError):
+        return None, None
+    if isinstance(data, dict):
+        return data.get("bytes"), data.get("completed_at")
+    if isinstance(data, int):
+        return data, None
+    return None, None
 
 
 def get_dir_size_gb(path):
-    """Get directory size in GB using du -s."""
-    result = subprocess.run(
-        ["du", "-sb", str(path)],
-        capture_output=True, text=True
-    )
-    if result.returncode == 0:
-        size_bytes = int(result.stdout.split()[0])
+    """Get directory size in GB, preferring the .size sidecar over a walk.
+
+    Old backups are immutable, so once a size has been computed we store
+    it next to the backup and a later listing is a single small read
+    instead of a scan of the whole tree.
+    """
+    size_bytes, _ = _read_sidecar(path)
+    if size_bytes is not None:
         return size_bytes / (1024**3)
-    return 0.0
+
+    size_bytes = _dir_size(path)
+    try:
+        # Deliberately no completed_at: we don't know when this backup
+        # ran, so the unchanged-library check must not trust it.
+        (Path(path) / SIZE_SIDECAR).write_text(json.dumps({"bytes": size_bytes}))
+    except OSError:
+        pass  # read-only or full disk; we'll just walk again next time
+    return size_bytes / (1024**3)
+
+
+def _backup_disk_rotational():
+    """True if the disk behind MOUNT_POINT spins (or we can't tell)."""
+    try:
+        st = os.stat(MOUNT_POINT)
+        devpath = f"/sys/dev/block/{os.major(st.st_dev)}:{os.minor(st.st_dev)}"
+        # The mount is usually a partition; queue/ lives on the parent disk.
+        for candidate in (f"{devpath}/queue/rotational",
+                          f"{devpath}/../queue/rotational"):
+            try:
+                with open(candidate) as f:
+                    return f.read().strip() == "1"
+            except OSError:
+                continue
+    except OSError:
+        pass
+    return True  # can't tell; assume spinning and stay sequential
 
 
 def list_backups():
@@ -70,9 +201,19 @@ def list_backups():
         print("\nNo existing backups found.")
         return backups
 
+    # Sidecar reads are instant; only backups without one cost a walk.
+    # Overlap those walks when the disk can serve concurrent metadata
+    # streams (SSD); stay sequential on spinning disks, where competing
+    # walkers just fight over the head.
+    workers = 1 if _backup_disk_rotational() else min(4, len(backups))
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            sizes = list(pool.map(get_dir_size_gb, backups))
+    else:
+        sizes = [get_dir_size_gb(b) for b in backups]
+
     print(f"\nExisting backups ({len(backups)}):")
-    for b in backups:
-        size_gb = get_dir_size_gb(b)
+    for b, size_gb in zip(backups, sizes):
         print(f"  {b.name}  ({size_gb:.2f} GB)")
     return backups
 
@@ -86,19 +227,147 @@ def maybe_delete_oldest():
     print(f"\nYou have {len(backups)} backups (max {MAX_BACKUPS}).")
     response = input(f"Delete oldest backup '{oldest.name}'? [y/N] ").strip().lower()
     if response == 'y':
-        print(f"Deleting {oldest.name}...")
-        shutil.rmtree(oldest)
-        print("Deleted.")
+        # Same-filesystem rename is atomic and instant; the actual unlink
+        # storm happens in the background once the backup is done.
+        trash = BACKUP_DIR / f".trash-{oldest.name}"
+        oldest.rename(trash)
+        _trash.append(trash)
+        get_backups(refresh=True)
+        print(f"Moved {oldest.name} to trash (deleted after backup).")
+
+
+def empty_trash():
+    for path in _trash:
+        subprocess.Popen(["rm", "-rf", str(path)],
+                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    _trash.clear()
+
+
+def sweep_stale_trash():
+    """Queue .trash-* directories left behind by an earlier failed run.
+
+    They're dot-filtered out of get_backups, so if a run dies before
+    empty_trash they'd otherwise sit invisible on the disk forever.
+    """
+    if not BACKUP_DIR.exists():
+        return
+    with os.scandir(BACKUP_DIR) as it:
+        for e in it:
+            if e.name.startswith(".trash-") and e.is_dir(follow_symlinks=False):
+                _trash.append(Path(e.path))
 
 
-def stop_immich():
-    print("\nStopping Immich containers...")
-    subprocess.run(["docker", "compose", "stop"], cwd=SOURCE_DIR, check=True)
+# Talking HTTP to dockerd over its socket skips the compose CLI, which
+# re-parses the whole stack and costs up to seconds per invocation.
+DOCKER_SOCK = "/var/run/docker.sock"
+
+
+class _DockerSockConnection(http.client.HTTPConnection):
+    def __init__(self):
+        super().__init__("localhost")
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(DOCKER_SOCK)
+
+
+def _docker_api(method, path):
+    """One request to dockerd. Returns (status, body bytes)."""
+    conn = _DockerSockConnection()
+    try:
+        conn.request(method, path)
+        resp = conn.getresponse()
+        return resp.status, resp.read()
+    finally:
+        conn.close()
+
+
+def _compose_project_name():
+    try:
+        for line in (SOURCE_DIR / "docker-compose.yml").read_text().splitlines():
+            if line.startswith("name:"):
+                return line.split(":", 1)[1].strip()
+    except OSError:
+        pass
+    return SOURCE_DIR.name.lower()
+
+
+def _service_containers(service, all_containers=False):
+    """Ids of a compose service's containers, straight from dockerd."""
+    filters = json.dumps({
+        "label": [f"com.docker.compose.project={_compose_project_name()}",
+                  f"com.docker.compose.service={service}"]
+    })
+    path = "/containers/json?filters=" + urllib.parse.quote(filters)
+    if all_containers:
+        path += "&all=1"
+    status, body = _docker_api("GET", path)
+    if status != 200:
+        raise RuntimeError(f"docker API GET /containers/json returned {status}")
+    return [c["Id"] for c in json.loads(body)]
+
+
+def _service_running(service):
+    try:
+        # Without all=1 dockerd lists running containers only.
+        return bool(_service_containers(service))
+    except OSError:
+        return True  # can't reach dockerd; behave as before and try the stop
+
+
+def _stop_service(service, timeout=30):
+    for cid in _service_containers(service):
+        status, _ = _docker_api("POST", f"/containers/{cid}/stop?t={timeout}")
+        if status not in (204, 304):
+            raise RuntimeError(f"docker API stop of {service} returned {status}")
+
+
+def _start_service(service):
+    for cid in _service_containers(service, all_containers=True):
+        status, _ = _docker_api("POST", f"/containers/{cid}/start")
+        if status not in (204, 304):
+            raise RuntimeError(f"docker API start of {service} returned {status}")
+
+
+def stop_immich_async():
+    """Begin stopping immich-server without waiting.
+
+    Only the application layer needs to be quiesced while the library
+    syncs; the database stays up and gets a hot base backup instead.
+    Returns a Future for the stop, or None when the service is already
+    down (then we neither wait nor restart it later).
+    """
+    if not _service_running("immich-server"):
+        return None
+    print("\nStopping immich-server (in background)...")
+    pool = ThreadPoolExecutor(max_workers=1)
+    future = pool.submit(_stop_service, "immich-server")
+    pool.shutdown(wait=False)
+    return future
 
 
 def start_immich():
-    print("\nStarting Immich containers...")
-    subprocess.run(["docker", "compose", "start"], cwd=SOURCE_DIR, check=True)
+    print("\nStarting immich-server...")
+    _start_service("immich-server")
+
+
+@contextmanager
+def immich_paused(stop_future):
+    """Run the block with immich-server stopped.
+
+    Takes the in-flight stop from stop_immich_async (so the container
+    shutdown overlaps the size walks and prompts that precede the
+    backup), waits for it to land, and restarts the service on exit.
+    A None stop_future means the service was already down; then we
+    leave it down afterwards too.
+    """
+    if stop_future is not None:
+        stop_future.result()  # propagates a failed stop
+    try:
+        yield
+    finally:
+        if stop_future is not None:
+            start_immich()
 
 
 def check_today_exists():
@@ -115,26 +384,241 @@ def check_today_exists():
     return dest, True
 
 
-def run_backup(dest):
-    dest.mkdir(parents=True, exist_ok=True)
-
-    print(f"\nBacking up to: {dest}")
-    for vol in VOLUMES_TO_BACKUP:
-        src = SOURCE_DIR / vol
-        if not src.exists():
-            print(f"  Skipping {vol} (not found)")
+def _db_username():
+    env_file = SOURCE_DIR / ".env"
+    try:
+        for line in env_file.read_text().splitlines():
+            if line.startswith("DB_USERNAME="):
+                return line.split("=", 1)[1].strip()
+    except FileNotFoundError:
+        pass
+    return "postgres"
+
+
+def _pg_basebackup_cmd():
+    # -X fetch bundles the WAL into the single tar so it can stream to stdout.
+    return [
+        "docker", "compose", "exec", "-T", "database",
+        "pg_basebackup", "-D", "-", "-Ft", "-z", "-X", "fetch",
+        "-U", _db_username(),
+    ]
+
+
+_TOTAL_SIZE_RE = re.compile(r"Total file size:\s+([\d,]+)")
+
+
+def _run_rsync(cmd):
+    """Run rsync, echoing progress at most ~5 Hz while capturing all
+    output for --stats parsing.
+
+    --info=progress2 repaints constantly; with an inherited tty each
+    repaint is a blocking terminal write, so on a slow console or ssh
+    session rsync itself stalls on progress lines. Reading from a pipe
+    and throttling redraws decouples transfer speed from terminal speed.
+    """
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT, bufsize=0)
+    fd = proc.stdout.fileno()
+    chunks = []
+    last_draw = 0.0
+    shown = 0  # how many chunks have been echoed so far
+    while True:
+        ready, _, _ = select.select([fd], [], [], 0.2)
+        if not ready:
+            if proc.poll() is not None:
+                # rsync exited; drain whatever is still in the pipe so
+                # the --stats tail is never lost.
+                while True:
+                    chunk = os.read(fd, 65536)
+                    if not chunk:
+                        break
+                    chunks.append(chunk)
+                break
+            continue
+        chunk = os.read(fd, 65536)
+        if not chunk:
+            break
+        chunks.append(chunk)
+        now = time.monotonic()
+        if now - last_draw >= 0.2:
+            sys.stdout.buffer.write(chunk)
+            sys.stdout.flush()
+            last_draw = now
+            shown = len(chunks)
+    # The throttle only skips intermediate progress repaints; whatever
+    # came after the last redraw (the 100% line, the stats summary) must
+    # still reach the terminal.
+    if shown < len(chunks):
+        sys.stdout.buffer.write(b"".join(chunks[shown:]))
+        sys.stdout.flush()
+    returncode = proc.wait()
+    if returncode != 0:
+        raise subprocess.CalledProcessError(returncode, cmd)
+    return b"".join(chunks).decode("utf-8", "replace")
+
+
+def _drop_page_cache(root):
+    """Advise the kernel to evict the backup's pages from the page cache.
+
+    A multi-GB write burst to the external disk otherwise lingers in
+    cache and pushes out the running Immich services' hot pages; the
+    backup data will never be read back in normal operation.
+
+    Best-effort: DONTNEED only evicts clean pages, so anything still
+    dirty from the write burst merely gets its writeback kicked off and
+    is reclaimed once flushed.
+    """
+    stack = [str(root)]
+    while stack:
+        try:
+            it = os.scandir(stack.pop())
+        except FileNotFoundError:
             continue
-        print(f"  Syncing {vol}...")
+        with it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+                elif entry.is_file(follow_symlinks=False):
+                    try:
+                        fd = os.open(entry.path, os.O_RDONLY)
+                    except OSError:
+                        continue
+                    try:
+                        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+                    finally:
+                        os.close(fd)
+
+
+def _max_mtime(root):
+    """Newest mtime of anything under root (files and directories)."""
+    newest = os.lstat(root).st_mtime
+    stack = [str(root)]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            for entry in it:
+                st = entry.stat(follow_symlinks=False)
+                if st.st_mtime > newest:
+                    newest = st.st_mtime
+                if entry.is_dir(follow_symlinks=False):
+                    stack.append(entry.path)
+    return newest
+
+
+def _kernel_at_least(major, minor):
+    release = os.uname().release.split("-")[0].split(".")
+    try:
+        return (int(release[0]), int(release[1])) >= (major, minor)
+    except (ValueError, IndexError):
+        return False
+
+
+def backup_library(dest, prev=None):
+    """Sync the library volume. Returns its byte total per rsync --stats,
+    or None when that isn't available (wcp path, missing volume)."""
+    src = SOURCE_DIR / "library"
+    if not src.exists():
+        print("  Skipping library (not found)")
+        return None
+
+    prev_bytes, prev_completed = _read_sidecar(prev) if prev is not None else (None, None)
+    if (prev_completed is not None and (prev / "library").is_dir()
+            and not (dest / "library").exists()
+            and _max_mtime(src) <= prev_completed):
+        # Nothing in the library has changed since the previous backup
+        # finished (no uploads today). A metadata-only mtime scan is far
+        # cheaper than rsync walking both trees, so just clone the
+        # previous tree as hardlinks and skip the sync entirely. The
+        # comparison point is the completion timestamp we recorded, not
+        # the directory mtime, which gets bumped by unrelated writes.
+        print("  Library unchanged since last backup; hardlinking previous tree...")
+        subprocess.run([
+            "cp", "-al", str(prev / "library"), str(dest / "library")
+        ], check=True)
+        try:
+            return prev_bytes - (prev / "postgres.tar.gz").stat().st_size
+        except (OSError, TypeError):
+            return None
+
+    if prev is None and shutil.which("wcp") and _kernel_at_least(5, 6):
+        # First-ever backup: nothing to --delete or hardlink against, so
+        # wcp's io_uring engine can batch thousands of copies per syscall
+        # instead of rsync's read/write pairs. Incremental runs stay on
+        # rsync, which wcp can't replace (no --delete / --link-dest).
+        print("  Copying library with wcp (io_uring)...")
         subprocess.run([
-            "rsync", "-a", "--delete", "--info=progress2",
-            str(src) + "/",
-            str(dest / vol) + "/"
+            "wcp", str(src) + "/", str(dest / "library") + "/"
         ], check=True)
+        return None
+
+    print("  Syncing library...")
+    # --no-inc-recursive builds the whole file list up front instead of
+    # interleaving stat storms with the transfer, so writes to the HDD
+    # stay sequential. Costs ~100 bytes of RAM per file, which is fine
+    # even for a very large library.
+    # --whole-file: both sides are local, so the delta algorithm would
+    # checksum old and new just to write the same bytes anyway.
+    # --preallocate: one fallocate per file keeps extents contiguous on
+    # the backup disk.
+    cmd = ["rsync", "-a", "-H", "--delete", "--whole-file", "--preallocate",
+           "--no-inc-recursive", "--info=progress2", "--stats"]
+    if prev is not None and (prev / "library").is_dir():
+        # Files unchanged since the previous backup become hardlinks into
+        # it (both trees live under BACKUP_DIR, so same filesystem); only
+        # the delta is actually copied. Same trick as rsnapshot.
+        cmd.append(f"--link-dest={prev / 'library'}/")
+    cmd += [str(src) + "/", str(dest / "library") + "/"]
+    out = _run_rsync(cmd)
+    match = _TOTAL_SIZE_RE.search(out)
+    return int(match.group(1).replace(",", "")) if match else None
+
+
+def run_backup(dest, parallel=False):
+    # Most recent prior backup (today's dir doesn't count when overwriting).
+    prev = next((b for b in reversed(get_backups()) if b != dest), None)
+    dest.mkdir(parents=True, exist_ok=True)
 
+    print(f"\nBacking up to: {dest}")
+    pg_out = open(dest / "postgres.tar.gz", "wb")
+
+    if parallel:
+        # The database streams its base backup while rsync works the
+        # library; pays off when the volumes sit on separate disks.
+        print("  Backing up postgres (pg_basebackup, in background)...")
+        pg_log = open(dest / "pg_basebackup.log", "w")
+        pg_proc = subprocess.Popen(_pg_basebackup_cmd(), cwd=SOURCE_DIR,
+                                   stdout=pg_out, stderr=pg_log)
+        try:
+            lib_bytes = backup_library(dest, prev)
+        finally:
+            returncode = pg_proc.wait()
+            pg_out.close()
+            pg_log.close()
+        if returncode != 0:
+            raise subprocess.CalledProcessError(returncode, pg_proc.args)
+    else:
+        print("  Backing up postgres (pg_basebackup)...")
+        with pg_out:
+            subprocess.run(_pg_basebackup_cmd(), cwd=SOURCE_DIR,
+                           stdout=pg_out, check=True)
+        lib_bytes = backup_library(dest, prev)
+
+    # Byte total for the sidecar comes from rsync's own accounting plus
+    # one stat of the postgres tarball; walk the tree only if rsync
+    # couldn't tell us.
+    if lib_bytes is not None:
+        total_bytes = lib_bytes + (dest / "postgres.tar.gz").stat().st_size
+    else:
+        total_bytes = _dir_size(dest)
+    (dest / SIZE_SIDECAR).write_text(
+        json.dumps({"bytes": total_bytes, "completed_at": time.time()})
+    )
+    get_backups(refresh=True)
+    return total_bytes
 
-def show_backup_stats(backup_path):
-    size_gb = get_dir_size_gb(backup_path)
-    print(f"\nBackup complete: {backup_path.name} ({size_gb:.2f} GB)")
+
+def show_backup_stats(backup_path, total_bytes):
+    print(f"\nBackup complete: {backup_path.name} "
+          f"({total_bytes / (1024**3):.2f} GB)")
 
 
 def main():
@@ -145,16 +629,23 @@ TO RESTORE FROM A BACKUP:
   1. Stop Immich:
        cd /home/immich/Git/cachyos-immich && docker compose stop
 
-  2. Copy the backup folders back (replace YYYY-MM-DD with your backup date):
+  2. Copy the library back (replace YYYY-MM-DD with your backup date):
        sudo rsync -a --delete /run/media/immich/immich-backup/immich-backups/YYYY-MM-DD/library/ ./library/
-       sudo rsync -a --delete /run/media/immich/immich-backup/immich-backups/YYYY-MM-DD/postgres/ ./postgres/
 
-  3. Start Immich:
+  3. Restore postgres from the base backup into a fresh data directory:
+       sudo rm -rf ./postgres && sudo mkdir ./postgres
+       sudo tar -xzf /run/media/immich/immich-backup/immich-backups/YYYY-MM-DD/postgres.tar.gz -C ./postgres/
+
+  4. Start Immich:
        docker compose start
 """,
         formatter_class=argparse.RawDescriptionHelpFormatter
     )
-    parser.parse_args()
+    parser.add_argument(
+        "--parallel", action="store_true",
+        help="sync volumes concurrently (helps when they live on separate disks)"
+    )
+    args = parser.parse_args()
 
     print("=== Immich Backup ===")
 
@@ -169,42 +660,73 @@ TO RESTORE FROM A BACKUP:
         print(f"Error: {MOUNT_POINT} is not mounted.")
         return 1
 
-    # 2. Show stats and list backups
-    show_disk_stats()
-    list_backups()
-
-    # 3. Maybe delete oldest
-    maybe_delete_oldest()
+    # 2. Queue any trash a previous failed run left behind, then start
+    #    the immich-server shutdown; it overlaps the size walks and
+    #    prompts below instead of adding to them.
+    sweep_stale_trash()
+    stop_future = stop_immich_async()
 
-    # 4. Check if today's backup exists
-    backup_path, should_proceed = check_today_exists()
-    if not should_proceed:
+    def cancel():
         print("Backup cancelled.")
-        return 0
+        if stop_future is not None:
+            stop_future.result()
+            start_immich()
+        empty_trash()
 
-    # 5. Confirm before proceeding
-    response = input("\nProceed with backup? [Y/n] ").strip().lower()
-    if response == 'n':
-        print("Backup cancelled.")
-        return 0
+    try:
+        # 3. Show stats and list backups
+        before = disk_snapshot()
+        show_disk_stats(before)
+        list_backups()
+
+        # 4. Maybe delete oldest
+        maybe_delete_oldest()
+
+        # 5. Check if today's backup exists
+        backup_path, should_proceed = check_today_exists()
+        if not should_proceed:
+            cancel()
+            return 0
+
+        # 6. Confirm before proceeding
+        response = input("\nProceed with backup? [Y/n] ").strip().lower()
+        if response == 'n':
+            cancel()
+            return 0
+    except (KeyboardInterrupt, EOFError):
+        # Ctrl-C or EOF at a prompt: the stop launched in step 2 may be
+        # in flight, so bring the server back before bailing out.
+        print()
+        cancel()
+        return 1
 
-    # 6. Stop, backup, start
-    stop_immich()
-    backup_failed = False
+    # 7. Backup with immich-server paused. The stop is awaited before
+    #    the cleanup-guarded block: when overwriting an existing backup,
+    #    a failed stop must not delete a valid tree nothing has touched.
+    if stop_future is not None:
+        stop_future.result()
     try:
-        run_backup(backup_path)
+        with immich_paused(stop_future):
+            total_bytes = run_backup(backup_path, parallel=args.parallel)
     except Exception:
-        backup_failed = True
-        raise
-    finally:
-        if backup_failed and backup_path.exists():
+        if backup_path.exists():
             print(f"\nBackup failed, cleaning up {backup_path}...")
             shutil.rmtree(backup_path)
-        start_immich()
+        empty_trash()
+        raise
 
-    # 7. Show final stats
-    show_backup_stats(backup_path)
-    show_disk_stats()
+    # 8. Evict the backup from the page cache now that immich-server is
+    #    back up; this metadata pass has no business inside the outage.
+    _drop_page_cache(backup_path)
+
+    # 9. Show final stats, then let trashed backups delete in the
+    #    background. Snapshot first: once the detached rm -rf processes
+    #    start freeing space, the write delta would race them.
+    show_backup_stats(backup_path, total_bytes)
+    after = disk_snapshot()
+    empty_trash()
+    show_disk_stats(after)
+    print(f"  Wrote {(before.free - after.free) / (1024**3):.1f} GB this run.")
 
     return 0
 